@@ -6,16 +6,22 @@ database.py: handles server's database.
 __author__ = "Arthur Rennert"
 
 import logging
+import queue
 import sqlite3
 import protocol
+from contextlib import contextmanager
 
 DEFAULT_VALUE = 0
 
 
 class Client:
     """ Represents a client entry """
+    __slots__ = ('ID', 'Name', 'PublicKey', 'LastSeen', 'AESKey')
+
     def __init__(self, cid, cname, last_seen):
-        self.ID = bytes.fromhex(cid)  # Unique client ID, 16 bytes.
+        # Unique client ID, 16 bytes. Accept raw bytes as-is; only hex
+        # strings pay the decode.
+        self.ID = bytes.fromhex(cid) if isinstance(cid, str) else cid
         self.Name = cname  # Client's name, null terminated ascii string, 255 bytes.
         self.PublicKey = DEFAULT_VALUE  # Client's public key, 160 bytes.
         self.LastSeen = last_seen  # The Date & time of client's last request.
@@ -34,6 +40,8 @@ class Client:
 
 class File:
     """ Represents a file entry """
+    __slots__ = ('ID', 'FileName', 'PathName', 'Verified')
+
     def __init__(self, client_id, file_name, path_name, verified):
         self.ID = client_id  # Client ID, 16 bytes.
         self.FileName = file_name  # File's name, 255 bytes.
@@ -57,31 +65,82 @@ class Database:
     CLIENTS = 'clients'
     FILES = 'files'
 
+    # Fixed query constants. Combined with the persistent pool and each
+    # connection's statement cache, these stay prepared across calls.
+    QUERY_USERNAME_EXISTS = f"SELECT 1 FROM {CLIENTS} WHERE Name = ? LIMIT 1"
+    QUERY_ID_EXISTS = f"SELECT 1 FROM {CLIENTS} WHERE ID = ? LIMIT 1"
+    QUERY_INSERT_CLIENT = f"INSERT INTO {CLIENTS} VALUES (?, ?, ?, ?, ?) RETURNING ID"
+    QUERY_SET_LAST_SEEN = f"UPDATE {CLIENTS} SET LastSeen = ? WHERE ID = ?"
+    QUERY_SET_PUBLIC_KEY = f"UPDATE {CLIENTS} SET PublicKey = ? WHERE ID = ?"
+    QUERY_SET_AES_KEY = f"UPDATE {CLIENTS} SET AESKey = ? WHERE ID = ?"
+    QUERY_GET_CLIENT_ID = f"SELECT ID FROM {CLIENTS} WHERE Name = ?"
+    QUERY_GET_CLIENT_NAME = f"SELECT Name FROM {CLIENTS} WHERE ID = ?"
+    QUERY_GET_PUBLIC_KEY = f"SELECT PublicKey FROM {CLIENTS} WHERE ID = ?"
+    QUERY_GET_AES_KEY = f"SELECT AESKey FROM {CLIENTS} WHERE ID = ?"
+    QUERY_GET_FILE_VERIFIED = f"SELECT Verified FROM {FILES} WHERE PathName = ?"
+    QUERY_INSERT_FILE = f"INSERT OR IGNORE INTO {FILES} VALUES (?, ?, ?, ?)"
+    QUERY_SET_FILE_VERIFIED = f"UPDATE {FILES} SET Verified = ? WHERE PathName = ?"
+
+    # journal_mode=WAL is persistent per database file, so it is issued once at bootstrap.
+    # The remaining PRAGMAs are per-connection and applied on every connect.
+    CONNECTION_PRAGMAS = """
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+        PRAGMA busy_timeout=5000;
+        """
+
+    POOL_SIZE = 4  # Pre-opened connections kept alive for the lifetime of the server.
+
     def __init__(self, name):
         self.name = name
+        conn = sqlite3.connect(self.name)
+        conn.execute("PRAGMA journal_mode=WAL")  # safe with synchronous=NORMAL, cuts fsync-per-commit cost.
+        conn.close()
+        # Pool of persistent connections; opening one per query pays connection
+        # setup and page-cache warm-up on every call.
+        self._pool = queue.Queue()
+        for _ in range(Database.POOL_SIZE):
+            self._pool.put(self.connect())
+        # In-memory caches for per-message lookups. The cached values are
+        # effectively immutable after registration, so writers update the
+        # cache (write-through) and readers skip the SQLite round-trip.
+        self._pk_cache = {}
+        self._aes_cache = {}
+        self._name_cache = {}
 
     def connect(self):
-        conn = sqlite3.connect(self.name)  # doesn't raise exception.
-        conn.text_factory = bytes
+        # isolation_level=None (autocommit) stops sqlite3 from opening an
+        # implicit transaction before DML; pooled connections must never go
+        # back holding one. transaction() manages BEGIN/COMMIT explicitly.
+        conn = sqlite3.connect(self.name, check_same_thread=False, cached_statements=128,
+                               isolation_level=None)  # doesn't raise exception.
+        conn.executescript(Database.CONNECTION_PRAGMAS)
         return conn
 
     def executescript(self, script):
-        conn = self.connect()
+        conn = self._pool.get()
         try:
             conn.executescript(script)
             conn.commit()
-        except:
-            pass  # table might exist already
-        conn.close()
+        except Exception as e:
+            logging.exception(f'database executescript: {e}')
+        finally:
+            self._pool.put(conn)
 
-    def execute(self, query, args, commit=False, get_last_row=False):
+    def execute(self, query, args, commit=False, get_last_row=False, returning=False):
         """ Given a query and args, execute query, and return the results """
         results = None
-        conn = self.connect()
+        conn = self._pool.get()
         try:
             cur = conn.cursor()
             cur.execute(query, args)
-            if commit:
+            if returning:
+                # RETURNING folds the write and the follow-up read into one
+                # statement (SQLite >= 3.35); hand back the first row.
+                results = cur.fetchone()
+                conn.commit()
+            elif commit:
                 conn.commit()
                 results = True
             else:
@@ -90,25 +149,42 @@ class Database:
                 results = cur.lastrowid  # special query.
         except Exception as e:
             logging.exception(f'database execute: {e}')
-        conn.close()  # commit is not required.
+            conn.rollback()  # never return a connection mid-transaction.
+        finally:
+            self._pool.put(conn)
         return results
 
+    @contextmanager
+    def transaction(self):
+        """ Batch several statements into a single transaction (one commit) """
+        conn = self._pool.get()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
     def initialize(self):
-        # Try to create Clients table
+        # Create Clients table if it doesn't exist yet
         self.executescript(f"""
-            CREATE TABLE {Database.CLIENTS}(
-              ID CHAR(16) NOT NULL PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS {Database.CLIENTS}(
+              ID BLOB NOT NULL PRIMARY KEY,
               Name CHAR(255) NOT NULL,
-              PublicKey CHAR(160) NOT NULL,
+              PublicKey BLOB NOT NULL,
               LastSeen DATE,
-              AESKey CHAR(16) NOT NULL
+              AESKey BLOB NOT NULL
             );
             """)
 
-        # Try to create Files table
+        # Create Files table if it doesn't exist yet
         self.executescript(f"""
-            CREATE TABLE {Database.FILES}(
-              ID CHAR(16) NOT NULL PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS {Database.FILES}(
+              ID BLOB NOT NULL PRIMARY KEY,
               FileName CHAR(255) NOT NULL,
               PathName CHAR(255) NOT NULL,
               Verified BIT,
@@ -116,62 +192,106 @@ class Database:
             );
             """)
 
+        # Indexes for the lookups that filter on non-key columns
+        # (client_username_exists, get_is_file_verified, update_file_verified).
+        self.executescript(f"""
+            CREATE INDEX IF NOT EXISTS idx_clients_name ON {Database.CLIENTS}(Name);
+            CREATE INDEX IF NOT EXISTS idx_files_path ON {Database.FILES}(PathName);
+            """)
+
     def client_username_exists(self, username):
         """ Check whether a username already exists in the database """
-        results = self.execute(f"SELECT * FROM {Database.CLIENTS} WHERE Name = ?", [username])
-        if not results:
-            return False
-        return len(results) > 0
+        return bool(self.execute(Database.QUERY_USERNAME_EXISTS, [username]))
 
     def client_id_exists(self, client_id):
         """ Check whether a client ID already exists within the database """
-        results = self.execute(f"SELECT * FROM {Database.CLIENTS} WHERE ID = ?", [client_id])
-        if not results:
-            return False
-        return len(results) > 0
+        return bool(self.execute(Database.QUERY_ID_EXISTS, [client_id]))
 
     def store_client(self, client):
         """ Stores a client into the database """
         if not type(client) is Client or not client.validate():
             return False
-        return self.execute(f"INSERT INTO {Database.CLIENTS} VALUES (?, ?, ?, ?, ?)",
-                            [client.ID, client.Name, client.PublicKey, client.LastSeen, client.AESKey], True)
+        results = self.execute(Database.QUERY_INSERT_CLIENT,
+                               [client.ID, client.Name, client.PublicKey, client.LastSeen, client.AESKey],
+                               returning=True)
+        if results:
+            self._name_cache[client.ID] = client.Name
+        return results
 
     def set_last_seen(self, client_id, time):
         """ Set client's last seen given a client id and the current time """
-        return self.execute(f"UPDATE {Database.CLIENTS} SET LastSeen = ? WHERE ID = ?",
+        return self.execute(Database.QUERY_SET_LAST_SEEN,
                             [time, client_id], True)
 
+    def set_last_seen_many(self, pairs):
+        """ Flush a batch of (time, client_id) last-seen updates with a single
+        commit, amortizing the per-transaction cost across the batch """
+        try:
+            with self.transaction() as cur:
+                cur.executemany(Database.QUERY_SET_LAST_SEEN, pairs)
+            return True
+        except Exception as e:
+            logging.exception(f'database set_last_seen_many: {e}')
+            return False
+
     def set_public_key(self, client_id, public_key):
         """ Set client's public key given a client id and a client public key """
-        return self.execute(f"UPDATE {Database.CLIENTS} SET PublicKey = ? WHERE ID = ?",
-                            [public_key, client_id], True)
+        results = self.execute(Database.QUERY_SET_PUBLIC_KEY,
+                               [public_key, client_id], True)
+        if results:
+            self._pk_cache[client_id] = public_key
+        return results
+
+    def set_client_keys(self, client_id, public_key, aes_key):
+        """ Set client's public key and aes key in a single transaction (one commit) """
+        try:
+            with self.transaction() as cur:
+                cur.execute(Database.QUERY_SET_PUBLIC_KEY, [public_key, client_id])
+                cur.execute(Database.QUERY_SET_AES_KEY, [aes_key, client_id])
+            self._pk_cache[client_id] = public_key
+            self._aes_cache[client_id] = aes_key
+            return True
+        except Exception as e:
+            logging.exception(f'database set_client_keys: {e}')
+            return False
 
     def get_client_id(self, name):
         """ Get client ID by given client name """
-        return self.execute(f"SELECT ID FROM {Database.CLIENTS} WHERE Name = ?", [name])[0][0]
+        return self.execute(Database.QUERY_GET_CLIENT_ID, [name])[0][0]
 
     def get_client_name(self, client_id):
         """ Get client name by given client ID """
-        return self.execute(f"SELECT Name FROM {Database.CLIENTS} WHERE ID = ?", [client_id])[0][0]
+        name = self._name_cache.get(client_id)
+        if name is None:
+            name = self.execute(Database.QUERY_GET_CLIENT_NAME, [client_id])[0][0]
+            self._name_cache[client_id] = name
+        return name
 
     def get_client_public_key(self, client_id):
         """ Given a client id, return the client's public key """
-        results = self.execute(f"SELECT PublicKey FROM {Database.CLIENTS} WHERE ID = ?", [client_id])
-        if not results:
-            return None
-        return results[0][0]
+        public_key = self._pk_cache.get(client_id)
+        if public_key is None:
+            results = self.execute(Database.QUERY_GET_PUBLIC_KEY, [client_id])
+            if not results:
+                return None
+            public_key = results[0][0]
+            self._pk_cache[client_id] = public_key
+        return public_key
 
     def get_client_aes(self, client_id):
         """ Get client's aes key by given client ID """
-        results = self.execute(f"SELECT AESKey FROM {Database.CLIENTS} WHERE ID = ?", [client_id])
-        if not results:
-            return None
-        return results[0][0]
+        aes_key = self._aes_cache.get(client_id)
+        if aes_key is None:
+            results = self.execute(Database.QUERY_GET_AES_KEY, [client_id])
+            if not results:
+                return None
+            aes_key = results[0][0]
+            self._aes_cache[client_id] = aes_key
+        return aes_key
 
     def get_is_file_verified(self, file_path):
         """ Get whether file verified given a PathName """
-        results = self.execute(f"SELECT Verified FROM {Database.FILES} WHERE PathName = ?", [file_path])
+        results = self.execute(Database.QUERY_GET_FILE_VERIFIED, [file_path])
         if not results:
             return None
         return results[0][0]
@@ -181,16 +301,19 @@ class Database:
         if self.client_id_exists(client_id) is False:
             print(f"Client with id {client_id} doesn't exist")
             return False
-        return self.execute(f"UPDATE {Database.CLIENTS} SET AESKey = ? WHERE ID = ?", [key, client_id], True)
+        results = self.execute(Database.QUERY_SET_AES_KEY, [key, client_id], True)
+        if results:
+            self._aes_cache[client_id] = key
+        return results
 
     def insert_new_file(self, file):
         """ Insert new client's file to the database """
         if not type(file) is File or not file.validate():
             return False
-        return self.execute(f"INSERT OR IGNORE INTO {Database.FILES} VALUES (?, ?, ?, ?)",
+        return self.execute(Database.QUERY_INSERT_FILE,
                             [file.ID, file.FileName, file.PathName, file.Verified], True)
 
     def update_file_verified(self, file_path, bool_val):
         """ Update whether file is verified (crc check with client succeeded) """
-        return self.execute(f"UPDATE {Database.FILES} SET Verified = ? WHERE PathName = ?",
+        return self.execute(Database.QUERY_SET_FILE_VERIFIED,
                             [bool_val, file_path], True)
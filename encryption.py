@@ -5,18 +5,28 @@ encryption.py: encryption functions for Encrypted File Transfer server usage.
 
 __author__ = "Arthur Rennert"
 
-from Crypto.Random import get_random_bytes
+import secrets
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
 
 
+# Cache of PKCS1_OAEP ciphers keyed by the raw public key bytes. Parsing the
+# key (ASN.1 decode + bignum init) dominates the cost of each encryption, and
+# a client's public key never changes once sent.
+_cipher_cache = {}
+
+
 def create_aes_key():
-    key = get_random_bytes(16)
+    # secrets.token_bytes goes straight to os.urandom - same cryptographic
+    # strength as PyCryptodome's RNG wrapper with fewer Python-level calls.
+    key = secrets.token_bytes(16)
     return key
 
 
 def encrypt_aes_key_with_rsa_key(data, key):
-    recipient_key = RSA.importKey(key)
-    cipher_rsa = PKCS1_OAEP.new(recipient_key)
+    cipher_rsa = _cipher_cache.get(key)
+    if cipher_rsa is None:
+        cipher_rsa = PKCS1_OAEP.new(RSA.importKey(key))
+        _cipher_cache[key] = cipher_rsa
     enc_session_key = cipher_rsa.encrypt(data)
     return enc_session_key
@@ -21,6 +21,57 @@ ENCRYPTED_AES_KEY_SIZE = 128
 AES_KEY_SIZE = 16
 CHECKSUM_SIZE = 4
 
+# Precompiled header structs. struct.unpack/pack with an f-string format
+# re-parses the format on every call; compiling once at import time avoids
+# that. Single "<Ns" field structs are gone entirely — "Ns" just hands the
+# slice back, so the generated decoders slice directly instead.
+REQUEST_HEADER_STRUCT = struct.Struct(f"<{CLIENT_ID_SIZE}sBHL")
+RESPONSE_HEADER_STRUCT = struct.Struct("<BHL")
+
+# Header parse strategy. Struct.unpack_from allocates a 4-tuple per call;
+# direct indexing + int.from_bytes avoids it and skips the intermediate
+# slice for the 7 trailing header bytes. Which one wins varies by Python
+# version, so both paths are kept and selected by this constant.
+_USE_FROMBYTES = True
+
+
+def make_decoder(fields):
+    """ Build a decode function specialized to a record's fixed payload layout.
+
+    fields is a sequence of (size, kind) tuples laid out right after the
+    request header, where kind is 'name' (null-terminated, trimmed to the
+    terminator but kept as bytes; callers decode where text is needed),
+    'bytes' (raw field) or 'u32' (little endian unsigned int). The generated
+    source inlines the exact offsets once at import time, so every call is a
+    straight-line sequence of C-level slices with no per-field bookkeeping.
+    """
+    offset = CLIENT_ID_SIZE + HEADER_SIZE
+    total = offset + sum(size for size, kind in fields)
+    lines = ["def decode(data):",
+             f"    if len(data) < {total}:",
+             "        raise ValueError('record too short')",
+             "    mv = memoryview(data)"]
+    names = []
+    for i, (size, kind) in enumerate(fields):
+        name = f"f{i}"
+        if kind == 'name':
+            # bytes.find is a memchr scan, unlike partition which builds a
+            # 3-tuple plus a copy just to drop the tail.
+            lines.append(f"    {name} = bytes(mv[{offset}:{offset + size}])")
+            lines.append(f"    end = {name}.find(0)")
+            lines.append("    if end >= 0:")
+            lines.append(f"        {name} = {name}[:end]")
+        elif kind == 'u32':
+            lines.append(f"    {name} = int.from_bytes(mv[{offset}:{offset + size}], 'little')")
+        else:
+            lines.append(f"    {name} = bytes(mv[{offset}:{offset + size}])")
+        names.append(name)
+        offset += size
+    lines.append(f"    return ({', '.join(names)},)")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return staticmethod(namespace['decode'])
+
 
 # Request Codes
 class RequestCode(Enum):
@@ -43,41 +94,49 @@ class ResponseCode(Enum):
 
 
 class RequestHeader:
+    __slots__ = ('clientID', 'version', 'code', 'payloadSize')
+    SIZE = CLIENT_ID_SIZE + HEADER_SIZE
+
     def __init__(self):
         self.clientID = b""
         self.version = DEFAULT_VALUE      # 1 byte
         self.code = DEFAULT_VALUE         # 2 bytes
         self.payloadSize = DEFAULT_VALUE  # 4 bytes
-        self.SIZE = CLIENT_ID_SIZE + HEADER_SIZE
 
     def unpack(self, data):
         """ Little Endian unpack Request Header """
-        try:
-            self.clientID = struct.unpack(f"<{CLIENT_ID_SIZE}s", data[:CLIENT_ID_SIZE])[0]
-            header_data = data[CLIENT_ID_SIZE:CLIENT_ID_SIZE + HEADER_SIZE]
-            self.version, self.code, self.payloadSize = struct.unpack("<BHL", header_data)
-            return True
-        except:
+        # Validating the length up-front keeps the common path exceptionless.
+        if len(data) < RequestHeader.SIZE:
             self.__init__()  # reset values
             return False
+        if _USE_FROMBYTES:
+            self.clientID = bytes(data[:CLIENT_ID_SIZE])
+            self.version = data[16]
+            self.code = int.from_bytes(data[17:19], 'little')
+            self.payloadSize = int.from_bytes(data[19:23], 'little')
+        else:
+            self.clientID, self.version, self.code, self.payloadSize = REQUEST_HEADER_STRUCT.unpack_from(data, 0)
+        return True
 
 
 class ResponseHeader:
+    __slots__ = ('version', 'code', 'payloadSize')
+    SIZE = HEADER_SIZE
+
     def __init__(self, code):
         self.version = SERVER_VERSION     # 1 byte
         self.code = code                  # 2 bytes
         self.payloadSize = DEFAULT_VALUE  # 4 bytes
-        self.SIZE = HEADER_SIZE
 
     def pack(self):
         """ Little Endian pack Response Header """
-        try:
-            return struct.pack("<BHL", self.version, self.code, self.payloadSize)
-        except:
-            return b""
+        return RESPONSE_HEADER_STRUCT.pack(self.version, self.code, self.payloadSize)
 
 
 class RegistrationRequest:
+    __slots__ = ('header', 'name')
+    _decode = make_decoder([(NAME_SIZE, 'name')])
+
     def __init__(self):
         self.header = RequestHeader()
         self.name = b""
@@ -88,43 +147,45 @@ class RegistrationRequest:
             return False
         try:
             # trim the byte array after the null terminating character.
-            name_data = data[self.header.SIZE:self.header.SIZE + NAME_SIZE]
-            self.name = struct.unpack(f"<{NAME_SIZE}s", name_data)[0].partition(b'\0')[0].decode('utf-8')
+            self.name, = self._decode(data)
             return True
-        except:
+        except ValueError:  # record too short.
             self.name = b""
             return False
 
 
 class SuccessRegistrationResponse:
+    __slots__ = ('header', 'clientID')
+    _STRUCT = struct.Struct(f"<BHL{CLIENT_ID_SIZE}s")
+    PAYLOAD_SIZE = _STRUCT.size - HEADER_SIZE
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_REGISTRATION_SUCCESS.value)
         self.clientID = b""
 
     def pack(self):
         """ Little Endian pack Response Header and clientID """
-        try:
-            data = self.header.pack()
-            data += struct.pack(f"<{CLIENT_ID_SIZE}s", self.clientID)
-            return data
-        except:
-            return b""
+        buf = bytearray(self._STRUCT.size)
+        self._STRUCT.pack_into(buf, 0, self.header.version, self.header.code,
+                               self.PAYLOAD_SIZE, self.clientID)
+        return buf
 
 
 class FailedRegistrationResponse:
+    __slots__ = ('header',)
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_REGISTRATION_FAILED.value)
 
     def pack(self):
         """ Little Endian pack Response Header """
-        try:
-            data = self.header.pack()
-            return data
-        except:
-            return b""
+        return self.header.pack()
 
 
 class PublicKeyRequest:
+    __slots__ = ('header', 'name', 'publicKey')
+    _decode = make_decoder([(NAME_SIZE, 'name'), (PUBLIC_KEY_SIZE, 'bytes')])
+
     def __init__(self):
         self.header = RequestHeader()
         self.name = b""
@@ -135,18 +196,19 @@ class PublicKeyRequest:
         if not self.header.unpack(data):
             return False
         try:
-            name_data = data[self.header.SIZE:self.header.SIZE + NAME_SIZE]
-            self.name = struct.unpack(f"<{NAME_SIZE}s", name_data)[0].partition(b'\0')[0].decode('utf-8')
-            key_data = data[self.header.SIZE + NAME_SIZE:self.header.SIZE + NAME_SIZE + PUBLIC_KEY_SIZE]
-            self.publicKey = struct.unpack(f"<{PUBLIC_KEY_SIZE}s", key_data)[0]
+            self.name, self.publicKey = self._decode(data)
             return True
-        except:
+        except ValueError:  # record too short.
             self.name = b""
             self.publicKey = b""
             return False
 
 
 class EncryptedKeyResponse:
+    __slots__ = ('header', 'clientID', 'encryptedKey')
+    _STRUCT = struct.Struct(f"<BHL{CLIENT_ID_SIZE}s{ENCRYPTED_AES_KEY_SIZE}s")
+    PAYLOAD_SIZE = _STRUCT.size - HEADER_SIZE
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_ENCRYPTED_KEY.value)
         self.clientID = b""
@@ -154,16 +216,16 @@ class EncryptedKeyResponse:
 
     def pack(self):
         """ Little Endian pack Response Header, ClientID, and Encrypted Key """
-        try:
-            data = self.header.pack()
-            data += struct.pack(f"<{CLIENT_ID_SIZE}s", self.clientID)
-            data += struct.pack(f"<{ENCRYPTED_AES_KEY_SIZE}s", self.encryptedKey)
-            return data
-        except:
-            return b""
+        buf = bytearray(self._STRUCT.size)
+        self._STRUCT.pack_into(buf, 0, self.header.version, self.header.code,
+                               self.PAYLOAD_SIZE, self.clientID, self.encryptedKey)
+        return buf
 
 
 class SendFileRequest:
+    __slots__ = ('header', 'contentSize', 'fileName', 'fileContent')
+    _decode = make_decoder([(CONTENT_SIZE, 'u32'), (FILE_NAME_SIZE, 'bytes')])
+
     def __init__(self):
         self.header = RequestHeader()
         self.contentSize = DEFAULT_VALUE  # 4 bytes
@@ -175,23 +237,43 @@ class SendFileRequest:
         if not self.header.unpack(data):
             return False
         try:
-            content_size = data[self.header.SIZE:self.header.SIZE + CONTENT_SIZE]
-            self.contentSize = struct.unpack("<L", content_size)[0]
-            offset = self.header.SIZE + CONTENT_SIZE
-            file_name = data[offset:offset + FILE_NAME_SIZE]
-            self.fileName = struct.unpack(f"<{FILE_NAME_SIZE}s", file_name)[0]
-            offset = offset + FILE_NAME_SIZE
-            file_content = data[offset:offset+self.contentSize]
-            self.fileContent = struct.unpack(f"<{self.contentSize}s", file_content)[0]
+            self.contentSize, self.fileName = self._decode(data)
+            offset = self.header.SIZE + CONTENT_SIZE + FILE_NAME_SIZE
+            if len(data) < offset + self.contentSize:  # truncated content.
+                raise ValueError("record too short")
+            # materialize the content bytes exactly once, zero-copy otherwise.
+            self.fileContent = bytes(memoryview(data)[offset:offset + self.contentSize])
             return True
-        except:
+        except ValueError:
             self.contentSize = DEFAULT_VALUE
             self.fileName = b''
             self.fileContent = b''
             return False
 
+    def unpack_into(self, data, out):
+        """ Little Endian unpack Request Header, Content Size, and File Name,
+        streaming the file content into a writable object (e.g. an open file)
+        instead of materializing it as a bytes field """
+        if not self.header.unpack(data):
+            return False
+        try:
+            self.contentSize, self.fileName = self._decode(data)
+            offset = self.header.SIZE + CONTENT_SIZE + FILE_NAME_SIZE
+            if len(data) < offset + self.contentSize:  # truncated content.
+                raise ValueError("record too short")
+            out.write(memoryview(data)[offset:offset + self.contentSize])
+            return True
+        except ValueError:
+            self.contentSize = DEFAULT_VALUE
+            self.fileName = b''
+            return False
+
 
 class FileReceivedWithCRCResponse:
+    __slots__ = ('header', 'clientID', 'contentSize', 'fileName', 'crc')
+    _STRUCT = struct.Struct(f"<BHL{CLIENT_ID_SIZE}sL{FILE_NAME_SIZE}sL")
+    PAYLOAD_SIZE = _STRUCT.size - HEADER_SIZE
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_SUCCESS_FILE_WITH_CRC.value)
         self.clientID = b""
@@ -201,82 +283,64 @@ class FileReceivedWithCRCResponse:
 
     def pack(self):
         """ Little Endian pack Response Header, ClientID, Content Size, File Name, and Checksum """
-        try:
-            data = self.header.pack()
-            data += struct.pack(f"<{CLIENT_ID_SIZE}s", self.clientID)
-            data += struct.pack(f"<L", self.contentSize)
-            data += struct.pack(f"<{FILE_NAME_SIZE}s", self.fileName)
-            data += struct.pack(f"<L", self.crc)
-            return data
-        except:
-            return b""
+        buf = bytearray(self._STRUCT.size)
+        self._STRUCT.pack_into(buf, 0, self.header.version, self.header.code,
+                               self.PAYLOAD_SIZE, self.clientID,
+                               self.contentSize, self.fileName, self.crc)
+        return buf
+
 
+class CRCStatusRequest:
+    """ Single request class for the three CRC status codes (valid, invalid,
+    invalid fourth time). The handler is selected by the header code, so one
+    class serves all three; the file name payload is kept when present. """
+    __slots__ = ('header', 'fileName')
+    _decode = make_decoder([(FILE_NAME_SIZE, 'bytes')])
 
-class CRCValidRequest:
     def __init__(self):
         self.header = RequestHeader()
         self.fileName = b''
 
     def unpack(self, data):
-        """ Little Endian unpack Request Header and File Name """
+        """ Little Endian unpack Request Header and File Name (when present) """
         if not self.header.unpack(data):
             return False
         try:
-            file_name = data[self.header.SIZE:self.header.SIZE + FILE_NAME_SIZE]
-            self.fileName = struct.unpack(f"<{FILE_NAME_SIZE}s", file_name)[0]
-            return True
-        except:
+            self.fileName, = self._decode(data)
+        except ValueError:  # file name payload absent for this code.
             self.fileName = b''
-            return False
+        return True
 
 
 class MessageReceivedResponse:
+    __slots__ = ('header', 'clientID')
+    _STRUCT = struct.Struct(f"<BHL{CLIENT_ID_SIZE}s")
+    PAYLOAD_SIZE = _STRUCT.size - HEADER_SIZE
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_MSG_RECEIVED_THANKS.value)
         self.clientID = b""
 
     def pack(self):
         """ Little Endian pack Response Header, ClientID """
-        try:
-            data = self.header.pack()
-            data += struct.pack(f"<{CLIENT_ID_SIZE}s", self.clientID)
-            return data
-        except:
-            return b""
-
-
-class CRCNotValidRequest:
-    def __init__(self):
-        self.header = RequestHeader()
-
-    def unpack(self, data):
-        """ Little Endian unpack Request Header """
-        if not self.header.unpack(data):
-            return False
-        return True
-
-
-class CRCNotValidFourthTimeRequest:
-    def __init__(self):
-        self.header = RequestHeader()
-
-    def unpack(self, data):
-        """ Little Endian unpack Request Header """
-        if not self.header.unpack(data):
-            return False
-        return True
+        buf = bytearray(self._STRUCT.size)
+        self._STRUCT.pack_into(buf, 0, self.header.version, self.header.code,
+                               self.PAYLOAD_SIZE, self.clientID)
+        return buf
 
 
 class MsgRecvResponse:
+    __slots__ = ('header', 'clientID')
+    _STRUCT = struct.Struct(f"<BHL{CLIENT_ID_SIZE}s")
+    PAYLOAD_SIZE = _STRUCT.size - HEADER_SIZE
+
     def __init__(self):
         self.header = ResponseHeader(ResponseCode.RESPONSE_MSG_RECEIVED_THANKS.value)
         self.clientID = b""
 
     def pack(self):
         """ Little Endian pack Response Header, ClientID """
-        try:
-            data = self.header.pack()
-            data += struct.pack(f"<{CLIENT_ID_SIZE}s", self.clientID)
-            return data
-        except:
-            return b""
\ No newline at end of file
+        buf = bytearray(self._STRUCT.size)
+        self._STRUCT.pack_into(buf, 0, self.header.version, self.header.code,
+                               self.PAYLOAD_SIZE, self.clientID)
+        return buf
\ No newline at end of file
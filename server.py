@@ -5,33 +5,65 @@ server.py: contains Server class which has socket logics. Contains main loop of
 
 __author__ = "Arthur Rennert"
 
+import asyncio
+import collections
+import concurrent.futures
 import logging
-import selectors
+import os
 import uuid
-import socket
 import database
 import protocol
 import encryption
-import zlib
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
-from datetime import datetime
+try:
+    # isa-l computes the same polynomial with SIMD carry-less multiply
+    # folding; worthwhile on multi-MB uploads. Optional dependency.
+    from isal.isal_zlib import crc32
+except ImportError:
+    from zlib import crc32
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from datetime import datetime, timezone
+
+# Module-level bindings skip the attribute lookup on every request. All
+# timestamps use one clock (UTC) so LastSeen values stay comparable;
+# datetime.utcnow is deprecated since 3.12, hence now(timezone.utc).
+_now = datetime.now
+_utc = timezone.utc
+_uuid4 = uuid.uuid4
+
+log = logging.getLogger(__name__)
 
 
 class Server:
     DATABASE = 'server.db'
-    PACKET_SIZE = 1024  # Default packet size.
     MAX_QUEUED_CONN = 10  # Default maximum number of queued connections.
-    IS_BLOCKING = False  # Blocking indicator!
+    DECRYPT_CHUNK_SIZE = 65536  # Per-block size for the fused decrypt + CRC pass.
+    CIPHER_CACHE_SIZE = 1024  # Maximum cached AES key schedules.
+    NAME_CACHE_SIZE = 4096  # Maximum cached client ID -> name entries.
+    LAST_SEEN_FLUSH_INTERVAL = 5  # Seconds between batched last-seen flushes.
+    STREAM_LIMIT = 1 << 20  # Stream buffer high-water mark, sized for file payloads.
 
     def __init__(self, host, port):
         """ Initialize server. Map request codes to handles. """
         logging.basicConfig(format='[%(levelname)s - %(asctime)s]: %(message)s', level=logging.INFO, datefmt='%H:%M:%S')
         self.host = host
         self.port = port
-        self.sel = selectors.DefaultSelector()
         self.database = database.Database(Server.DATABASE)
         self.lastErr = ""  # Last Error description.
+        # Pool for CPU-heavy work (AES + CRC); OpenSSL releases the GIL, so
+        # decryption genuinely runs in parallel with the event loop.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+        # LRU of algorithms.AES wrappers keyed by client ID. The wrapper only
+        # binds the key bytes (OpenSSL expands the real key schedule when a
+        # decryptor is created); caching it avoids rebuilding the object and
+        # detects key rotation via the stored key comparison.
+        self._cipher_cache = collections.OrderedDict()
+        # LRU of client ID -> name, so handlers that mention the name several
+        # times per request hit a dict instead of the database layer.
+        self._name_cache = collections.OrderedDict()
+        # Pending last-seen timestamps, keyed by client ID. Updating a dict
+        # entry per request and flushing batches keeps the per-transaction
+        # commit cost off the request critical path.
+        self._last_seen = {}
         self.requestHandle = {
             protocol.RequestCode.REQUEST_REGISTRATION.value: self.handle_registration_request,
             protocol.RequestCode.REQUEST_SEND_PUBLIC_KEY.value: self.handle_encrypted_key_response,
@@ -41,196 +73,278 @@ class Server:
             protocol.RequestCode.REQUEST_CRC_INVALID_FOURTH_TIME.value: self.handle_crc_invalid_fourth_time_request
         }
 
-    def accept(self, sock, mask):
-        """ Accepts a connection from client """
-        conn, address = sock.accept()
-        conn.setblocking(Server.IS_BLOCKING)
-        self.sel.register(conn, selectors.EVENT_READ, self.read)
-
-    def read(self, conn, mask):
-        """ Reads data from the client and parses it """
-        logging.info("A client has connected.")
-        data = conn.recv(Server.PACKET_SIZE)
-        if data:
-            request_header = protocol.RequestHeader()
-            success = False
-            if not request_header.unpack(data):
-                logging.error("Failed to parse request header!")
+    async def handle_connection(self, reader, writer):
+        """ Per-connection coroutine. Reads a full request, dispatches it, and
+        responds. A slow decrypt no longer blocks other connections. """
+        log.info("A client has connected.")
+        request_header = protocol.RequestHeader()
+        success = False
+        try:
+            buf = bytearray(await reader.readexactly(protocol.RequestHeader.SIZE))
+            if not request_header.unpack(buf):
+                log.error("Failed to parse request header!")
             else:
+                if request_header.payloadSize:
+                    buf += await reader.readexactly(request_header.payloadSize)
+                view = memoryview(buf)
                 if request_header.code in self.requestHandle.keys():
-                    success = self.requestHandle[request_header.code](conn, data)
-            if not success:  # return generic error upon failure.
-                response_header = protocol.ResponseHeader(protocol.ResponseCode.RESPONSE_ERROR.value)
-                self.write(conn, response_header.pack())
-            self.database.set_last_seen(request_header.clientID, str(datetime.now()))
-        self.sel.unregister(conn)
-        conn.close()
-
-    def write(self, conn, data):
+                    success = await self.requestHandle[request_header.code](writer, view)
+        except asyncio.IncompleteReadError:  # connection closed mid-message.
+            writer.close()
+            return
+        except Exception as e:
+            log.exception("Request handling exception: %s", e)
+        if not success:  # return generic error upon failure.
+            response_header = protocol.ResponseHeader(protocol.ResponseCode.RESPONSE_ERROR.value)
+            await self.write(writer, response_header.pack())
+        self._last_seen[request_header.clientID] = _now(_utc).isoformat()
+        writer.close()
+
+    async def write(self, conn, data):
         """ Send a response to client"""
-        size = len(data)
-        sent = 0
-        while sent < size:
-            leftover = size - sent
-            if leftover > Server.PACKET_SIZE:
-                leftover = Server.PACKET_SIZE
-            to_send = data[sent:sent + leftover]
-            if len(to_send) < Server.PACKET_SIZE:
-                to_send += bytearray(Server.PACKET_SIZE - len(to_send))
-            try:
-                conn.send(to_send)
-                sent += len(to_send)
-            except:
-                logging.error("Failed to send response to " + conn)
-                return False
-        logging.info("Response sent successfully.")
+        try:
+            conn.write(bytes(data))
+            await conn.drain()
+        except OSError:
+            log.error("Failed to send response to %s", conn)
+            return False
+        log.info("Response sent successfully.")
         return True
 
+    def flush_last_seen(self):
+        """ Write all pending last-seen updates in one batched transaction """
+        if not self._last_seen:
+            return
+        pending, self._last_seen = self._last_seen, {}
+        self.database.set_last_seen_many([(time, client_id) for client_id, time in pending.items()])
+
+    async def flush_last_seen_loop(self):
+        """ Periodically flush batched last-seen updates """
+        while True:
+            await asyncio.sleep(Server.LAST_SEEN_FLUSH_INTERVAL)
+            self.flush_last_seen()
+
+    async def serve(self):
+        """ Bind and serve connections forever """
+        # A larger stream limit lets a whole file payload accumulate in the
+        # reader's C-level buffer without repeated transport pause/resume
+        # round-trips at the default 64 KiB high-water mark.
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                            backlog=Server.MAX_QUEUED_CONN,
+                                            limit=Server.STREAM_LIMIT)
+        self._flush_task = asyncio.create_task(self.flush_last_seen_loop())
+        print(f"Server is listening for connections on port {self.port}..")
+        async with server:
+            await server.serve_forever()
+
     def start(self):
-        """ Start listening for connections. Contains the main loop """
+        """ Start listening for connections. Runs the event loop """
         self.database.initialize()
         try:
-            sock = socket.socket()
-            sock.bind((self.host, self.port))
-            sock.listen(Server.MAX_QUEUED_CONN)
-            sock.setblocking(Server.IS_BLOCKING)
-            self.sel.register(sock, selectors.EVENT_READ, self.accept)
+            asyncio.run(self.serve())
         except Exception as e:
             self.lastErr = e
             return False
-        print(f"Server is listening for connections on port {self.port}..")
-        while True:
-            try:
-                events = self.sel.select()
-                for key, mask in events:
-                    callback = key.data
-                    callback(key.fileobj, mask)
-            except Exception as e:
-                logging.exception(f"Server main loop exception: {e}")
-
-    def handle_registration_request(self, conn, data):
+
+    def get_aes_algorithm(self, client_id):
+        """ Return the client's algorithms.AES wrapper, cached per client and
+        refreshed if the stored key changed. Note the wrapper just holds the
+        key — the key schedule itself is expanded inside OpenSSL each time a
+        decryptor is created """
+        aes_key = self.database.get_client_aes(client_id)
+        cached = self._cipher_cache.get(client_id)
+        if cached is None or cached[0] != aes_key:
+            cached = (aes_key, algorithms.AES(aes_key))
+            self._cipher_cache[client_id] = cached
+            if len(self._cipher_cache) > Server.CIPHER_CACHE_SIZE:
+                self._cipher_cache.popitem(last=False)
+        else:
+            self._cipher_cache.move_to_end(client_id)
+        return cached[1]
+
+    def _name(self, client_id):
+        """ Return the client's name, LRU-cached per client ID """
+        name = self._name_cache.get(client_id)
+        if name is None:
+            name = self.database.get_client_name(client_id)
+            self._name_cache[client_id] = name
+            if len(self._name_cache) > Server.NAME_CACHE_SIZE:
+                self._name_cache.popitem(last=False)
+        else:
+            self._name_cache.move_to_end(client_id)
+        return name
+
+    def _safe_path(self, client_name, file_name):
+        """ Build the on-disk path <client name>/<file name>, refusing names
+        that would escape the per-client directory. Both components come from
+        client-controlled input, so strip any directory part (basename, after
+        normalizing backslashes) and reject empty or '..' results. Returns
+        None for unsafe names. """
+        client_name = os.path.basename(client_name.replace('\\', '/'))
+        file_name = os.path.basename(file_name.replace('\\', '/'))
+        if not client_name or not file_name or client_name == '..' or file_name == '..':
+            return None
+        return os.path.join(client_name, file_name)
+
+    def decrypt_and_crc(self, client_id, ciphertext):
+        """ Decrypt the upload with OpenSSL's AES-CBC (AES-NI where available),
+        fusing the CRC into the same pass so every 64 KiB block is checksummed
+        while still cache-resident instead of re-reading the whole plaintext
+        afterwards. Returns (crc, plaintext). Runs on the executor. """
+        algorithm = self.get_aes_algorithm(client_id)
+        content_len = len(ciphertext)
+        decryptor = Cipher(algorithm, modes.CBC(bytes(16))).decryptor()
+        # update_into needs one cipher block of slack in the output buffer,
+        # hence the extra 15 bytes.
+        plain = bytearray(content_len + 15)
+        mv_in = memoryview(ciphertext)
+        mv_out = memoryview(plain)
+        crc = 0
+        last_block = content_len - 16  # final block carries the PKCS7 padding.
+        for offset in range(0, content_len, Server.DECRYPT_CHUNK_SIZE):
+            end = min(offset + Server.DECRYPT_CHUNK_SIZE, content_len)
+            decryptor.update_into(mv_in[offset:end], mv_out[offset:])
+            if offset < last_block:
+                crc = crc32(mv_out[offset:min(end, last_block)], crc)
+        decryptor.finalize()
+        pad = plain[content_len - 1]
+        if not 1 <= pad <= 16 or plain[content_len - pad:content_len] != bytes([pad]) * pad:
+            raise ValueError("bad PKCS7 padding")
+        crc = crc32(mv_out[last_block:content_len - pad], crc)
+        mv_in.release()
+        mv_out.release()
+        del plain[content_len - pad:]
+        return crc, plain
+
+    async def handle_registration_request(self, conn, data):
         """ Register a new user. Save to db. """
         request = protocol.RegistrationRequest()
         response_fail = protocol.FailedRegistrationResponse()
         if not request.unpack(data):
-            logging.error("Registration Request: Failed parsing request.")
-            return self.write(conn, response_fail.pack())
+            log.error("Registration Request: Failed parsing request.")
+            return await self.write(conn, response_fail.pack())
+        try:
+            # protocol keeps the name as trimmed bytes; decode once here
+            # where the text form is actually needed.
+            name = request.name.decode('utf-8')
+        except UnicodeDecodeError:
+            log.info("Registration Request: Invalid requested username.")
+            return await self.write(conn, response_fail.pack())
         try:
-            if not request.name != '' and all(ch.isalpha() or ch.isspace() for ch in request.name):
-                logging.info(f"Registration Request: Invalid requested username ({request.name}))")
-                return self.write(conn, response_fail.pack())
-            if self.database.client_username_exists(request.name):
-                logging.info(f"Registration Request: Username ({request.name}) already exists.")
-                return self.write(conn, response_fail.pack())
+            if not name != '' and all(ch.isalpha() or ch.isspace() for ch in name):
+                log.info("Registration Request: Invalid requested username (%s))", name)
+                return await self.write(conn, response_fail.pack())
+            if self.database.client_username_exists(name):
+                log.info("Registration Request: Username (%s) already exists.", name)
+                return await self.write(conn, response_fail.pack())
         except:
-            logging.error("Registration Request: Failed to connect to database.")
-            return self.write(conn, response_fail.pack())
-        client = database.Client(uuid.uuid4().hex, request.name, str(datetime.now()))
+            log.error("Registration Request: Failed to connect to database.")
+            return await self.write(conn, response_fail.pack())
+        client = database.Client(_uuid4().bytes, name, _now(_utc).isoformat())
         if not self.database.store_client(client):
-            logging.error(f"Registration Request: Failed to store client {request.name}.")
-            return self.write(conn, response_fail.pack())
+            log.error("Registration Request: Failed to store client %s.", name)
+            return await self.write(conn, response_fail.pack())
 
-        logging.info(f"Successfully registered client {request.name}.")
+        log.info("Successfully registered client %s.", name)
         response = protocol.SuccessRegistrationResponse()
         response.clientID = client.ID
-        response.header.payloadSize = protocol.CLIENT_ID_SIZE
-        return self.write(conn, response.pack())
+        return await self.write(conn, response.pack())
 
-    def handle_encrypted_key_response(self, conn, data):
+    async def handle_encrypted_key_response(self, conn, data):
         """ Respond with aes key """
         request = protocol.PublicKeyRequest()
         response = protocol.EncryptedKeyResponse()
 
         if not request.unpack(data):
-            logging.error("SendPublicKey Request: Failed to parse request header!")
-        client_id = self.database.get_client_id(request.name)
-        if not self.database.set_public_key(client_id, request.publicKey):
-            logging.error(f"Registration Request: Failed to store client {request.name} public key.")
-            return False
+            log.error("SendPublicKey Request: Failed to parse request header!")
+        name = request.name.decode('utf-8')
+        client_id = self.database.get_client_id(name)
         aes_key = encryption.create_aes_key()
-        # Store AES key in database
-        if self.database.update_aes_key(client_id, aes_key) is False:
-            print("Failed to update db with the new aes key")
+        # Store public key and AES key in database with a single commit.
+        if not self.database.set_client_keys(client_id, request.publicKey, aes_key):
+            log.error("Registration Request: Failed to store client %s keys.", name)
+            return False
         encrypted_aes = encryption.encrypt_aes_key_with_rsa_key(aes_key, request.publicKey)
         response.clientID = client_id
         response.encryptedKey = encrypted_aes
-        response.header.payloadSize = protocol.CLIENT_ID_SIZE + len(encrypted_aes)
-        logging.info(f"Encrypted Key response was successfully built to client {request.name}.")
-        return self.write(conn, response.pack())
+        log.info("Encrypted Key response was successfully built to client %s.", name)
+        return await self.write(conn, response.pack())
 
-    def handle_send_file_request(self, conn, data):
+    async def handle_send_file_request(self, conn, data):
         request = protocol.SendFileRequest()
         response = protocol.FileReceivedWithCRCResponse()
 
         if not request.unpack(data):
-            logging.error("SendFile Request: Failed to parse request header!")
+            log.error("SendFile Request: Failed to parse request header!")
 
-        decrypted_content = None
         try:
-            # get client aes key
-            aes_key = self.database.get_client_aes(request.header.clientID)
-
-            # create aes cipher from the key
-            cipher = AES.new(aes_key, AES.MODE_CBC, bytes(16))
-
-            # decrypt content
-            decrypted_content = cipher.decrypt(request.fileContent)
-            decrypted_content = unpad(decrypted_content, 16)
+            # CPU-heavy decrypt + CRC runs on the executor so the event loop
+            # keeps serving other connections meanwhile.
+            loop = asyncio.get_running_loop()
+            crc, decrypted_content = await loop.run_in_executor(
+                self._executor, self.decrypt_and_crc, request.header.clientID, request.fileContent)
         except:
-            logging.error("Failed to create AES key");
+            log.error("Failed to decrypt file content");
             return False
 
-        # store file in db
+        # Write the plaintext to disk in one buffered write; the database
+        # records metadata (path) only, keeping blobs out of its page cache.
         file_name = request.fileName.partition(b'\0')[0].decode('utf-8')
-        file_path = self.database.get_client_name(request.header.clientID).decode('utf-8') + '\\' + file_name
+        client_name = self._name(request.header.clientID)
+        file_path = self._safe_path(client_name, file_name)
+        if file_path is None:
+            log.error("SendFile Request: unsafe file name (%s).", file_name)
+            return False
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(decrypted_content)
         new_file = database.File(request.header.clientID, file_name, file_path, False)
         self.database.insert_new_file(new_file)
 
-        # calculate crc from the content
-        crc = zlib.crc32(decrypted_content)
-
         response.clientID = request.header.clientID
         response.contentSize = request.contentSize
         response.fileName = request.fileName
         response.crc = crc
-        response.header.payloadSize = protocol.CLIENT_ID_SIZE + protocol.CONTENT_SIZE + protocol.NAME_SIZE + protocol.CHECKSUM_SIZE
-        logging.info(f"Successfully sent crc response to client {self.database.get_client_name(request.header.clientID).decode('utf-8')}.")
-        return self.write(conn, response.pack())
+        log.info("Successfully sent crc response to client %s.", client_name)
+        return await self.write(conn, response.pack())
 
-    def handle_crc_valid_request(self, conn, data):
-        request = protocol.CRCValidRequest()
+    async def handle_crc_valid_request(self, conn, data):
+        request = protocol.CRCStatusRequest()
         response = protocol.MessageReceivedResponse()
 
         if not request.unpack(data):
-            logging.error("SendFile Request: Failed to parse request header!")
+            log.error("SendFile Request: Failed to parse request header!")
 
         file_name = request.fileName.partition(b'\0')[0].decode('utf-8')
-        file_path = self.database.get_client_name(request.header.clientID).decode('utf-8') + '\\' + file_name
+        client_name = self._name(request.header.clientID)
+        file_path = self._safe_path(client_name, file_name)
+        if file_path is None:
+            log.error("CRC valid Request: unsafe file name (%s).", file_name)
+            return False
         self.database.update_file_verified(file_path, True)
         response.clientID = request.header.clientID
-        response.header.payloadSize = protocol.CLIENT_ID_SIZE
-        logging.info(f"Confirmation message send to client {self.database.get_client_name(request.header.clientID).decode('utf-8')}.")
-        return self.write(conn, response.pack())
+        log.info("Confirmation message send to client %s.", client_name)
+        return await self.write(conn, response.pack())
 
-    def handle_crc_invalid_request(self, conn, data):
-        request = protocol.CRCNotValidRequest()
+    async def handle_crc_invalid_request(self, conn, data):
+        request = protocol.CRCStatusRequest()
 
         if not request.unpack(data):
-            logging.error("SendFile Request: Failed to parse request header!")
+            log.error("SendFile Request: Failed to parse request header!")
 
-        logging.info(
-            f"CRC not valid with client {self.database.get_client_name(request.header.clientID).decode('utf-8')}.")
+        # guard the name lookup: it only serves this log line.
+        if log.isEnabledFor(logging.INFO):
+            log.info("CRC not valid with client %s.", self._name(request.header.clientID))
         return True
 
-    def handle_crc_invalid_fourth_time_request(self, conn, data):
-        request = protocol.CRCNotValidFourthTimeRequest()
+    async def handle_crc_invalid_fourth_time_request(self, conn, data):
+        request = protocol.CRCStatusRequest()
         response = protocol.MsgRecvResponse()
 
         if not request.unpack(data):
-            logging.error("SendFile Request: Failed to parse request header!")
+            log.error("SendFile Request: Failed to parse request header!")
 
         response.clientID = request.header.clientID
-        response.header.payloadSize = protocol.CLIENT_ID_SIZE
-        logging.info(
-            f"CRC not valid with client {self.database.get_client_name(request.header.clientID).decode('utf-8')}. 3 times retried.")
-        return self.write(conn, response.pack())
+        if log.isEnabledFor(logging.INFO):
+            log.info("CRC not valid with client %s. 3 times retried.", self._name(request.header.clientID))
+        return await self.write(conn, response.pack())
@@ -0,0 +1,26 @@
+"""
+Encrypted File Transfer Server
+setup.py: optional build of the protocol module as a C extension.
+
+Running `python setup.py build_ext --inplace` with Cython installed compiles
+protocol.py; the resulting extension shadows the pure-Python file on import,
+removing interpreter overhead from per-request header parsing. Without
+Cython (or without building) the server runs on the pure-Python module
+unchanged, so this is a build-time opt-in rather than a runtime dependency.
+"""
+
+__author__ = "Arthur Rennert"
+
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = cythonize(["protocol.py"], language_level=3)
+
+setup(
+    name="encrypted-file-transfer-server",
+    ext_modules=ext_modules,
+)
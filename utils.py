@@ -20,7 +20,9 @@ def parse_port(filepath):
     port = None
     try:
         with open(filepath, "r") as port_info:
-            port = port_info.readline().strip()
+            # A port is at most 5 digits; cap the read so an oversized or
+            # malformed file never gets slurped into memory.
+            port = port_info.readline(16).strip()
             port = int(port)
     except (ValueError, FileNotFoundError):
         port = 1234